@@ -0,0 +1,77 @@
+"""bench/ 스크립트들이 함께 쓰는 도우미입니다.
+
+streamlit_app.py 는 `if __name__ == "__main__"` 일 때만 화면을 그리므로, 임시 작업 디렉터리로 옮겨 간 뒤
+모듈로 import 하면 Streamlit 서버 없이(bare mode) 저장소와 Gemini 클라이언트 클래스를 그대로 쓸 수 있습니다.
+가짜 Gemini 서버는 load_test.py 의 FakeGeminiServer 를 재사용합니다.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+def make_workdir(prefix="bench_", secrets=None):
+    """problems.json 을 복사한 임시 작업 디렉터리를 만들고 그 디렉터리로 이동합니다.
+
+    secrets 는 .streamlit/secrets.toml 에 그대로 쓸 TOML 텍스트입니다.
+    """
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    shutil.copy(os.path.join(APP_DIR, "problems.json"), workdir)
+    if secrets:
+        os.makedirs(os.path.join(workdir, ".streamlit"))
+        with open(os.path.join(workdir, ".streamlit", "secrets.toml"), "w", encoding="utf-8") as f:
+            f.write(secrets)
+    os.chdir(workdir)
+    return workdir
+
+
+def load_app(workdir=None, secrets=None):
+    """작업 디렉터리(기본값: 새 임시 디렉터리)에서 streamlit_app 모듈을 import 해 반환합니다."""
+    if workdir is None:
+        make_workdir(secrets=secrets)
+    else:
+        os.chdir(workdir)
+    # bare mode 경고(ScriptRunContext 없음)를 숨깁니다. 설정을 읽으면 로그 수준이 다시 정해지므로 먼저 읽어 둡니다.
+    import streamlit.config
+    import streamlit.logger
+    streamlit.config.get_config_options()
+    streamlit.config.set_option("logger.level", "error")
+    streamlit.logger.set_log_level("error")
+    import streamlit_app
+    return streamlit_app
+
+
+def start_fake_gemini(**options):
+    """load_test.FakeGeminiServer 를 백그라운드 스레드로 띄우고 반환합니다."""
+    from load_test import FakeGeminiServer
+    server = FakeGeminiServer(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fake_gemini_secrets(server, rpm=5000, daily=1_000_000, **extra):
+    """server 로 요청을 보내고 한도가 벤치마크를 막지 않도록 넉넉하게 잡은 secrets.toml 텍스트입니다."""
+    # json.dumps 는 문자열, 숫자, true/false 를 TOML 과 같은 표기로 씁니다.
+    lines = [f'GEMINI_API_BASE = "{server.base_url}"'] + [f"{key} = {json.dumps(value)}" for key, value in extra.items()]
+    lines += ["[GEMINI_API_KEYS]", 'bench = "bench-key"', "[GEMINI_MODELS]", f'"bench-model" = {{ rpm = {rpm}, daily = {daily} }}']
+    return "\n".join(lines) + "\n"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def check(condition, message):
+    """조건이 거짓이면 FAIL 을 출력하고 종료 코드 1 로 끝냅니다. 참이면 ok 를 출력합니다."""
+    print(f"{'ok  ' if condition else 'FAIL'} {message}")
+    if not condition:
+        sys.exit(1)
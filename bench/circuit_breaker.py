@@ -0,0 +1,106 @@
+"""가짜 Gemini 서버에 장애를 주입해 스트리밍 호출이 서킷 브레이커를 제대로 따르는지 확인합니다.
+
+1. 서버가 모든 요청에 503 을 돌려주면 스트리밍 호출 실패가 쌓여 브레이커가 열립니다.
+2. 열려 있는 동안의 스트리밍 호출은 서버에 요청을 보내지 않고 바로 거절됩니다.
+3. 쿨다운이 지나 서버가 회복되면 동시에 시작한 스트리밍 호출 중 시험 호출 하나만 서버로 가고, 그것이 성공하면 닫힙니다.
+4. 시험 호출이 된 스트림을 중간에 그만 읽어도 브레이커가 half-open 에 묶이지 않습니다.
+5. half-open 에서 일반 호출이 일일 한도 초과로 거절되면 브레이커는 닫히지 않고, 다음 호출이 다시 시험합니다.
+
+사용 예:
+    python bench/circuit_breaker.py
+    python bench/circuit_breaker.py --concurrent 20
+"""
+import argparse
+import asyncio
+import time
+
+from _common import check, fake_gemini_secrets, load_app, start_fake_gemini
+
+THRESHOLD, COOLDOWN = 3, 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrent", type=int, default=10, help="쿨다운 뒤 동시에 시작할 스트리밍 호출 수")
+    args = parser.parse_args()
+
+    server = start_fake_gemini(latency=0.01, jitter=0.0, error_rate=1.0)
+    app = load_app(secrets=fake_gemini_secrets(server, CIRCUIT_FAILURE_THRESHOLD=THRESHOLD, CIRCUIT_COOLDOWN=COOLDOWN))
+    client, breaker = app.get_gemini_client(), app.get_gemini_resilience().breaker
+    prompt, schema = app.build_hint_request({"title": "두 수의 합", "description": "a와 b를 더하세요"}, "Python")
+
+    async def stream(stop_after_first=False):
+        text = ""
+        chunks = app.stream_gemini_api(prompt, schema, kind="hint")
+        async for chunk in chunks:
+            text += chunk
+            if stop_after_first:
+                await chunks.aclose() # 화면을 떠나 더 읽지 않는 경우
+                break
+        return text
+
+    def outcomes(coroutines):
+        async def gather():
+            return await asyncio.gather(*coroutines, return_exceptions=True)
+        results = client.run(gather())
+        return {"ok": sum(isinstance(r, str) for r in results),
+                "rejected": sum(isinstance(r, app.CircuitOpenError) for r in results),
+                "failed": sum(isinstance(r, Exception) and not isinstance(r, app.CircuitOpenError) for r in results)}
+
+    for _ in range(THRESHOLD):
+        outcomes([stream()])
+    check(breaker.state == app.CircuitBreaker.OPEN, f"{THRESHOLD} failed streams opened the breaker (state {breaker.state})")
+
+    def rejections():
+        return app.get_metrics()._series()[1].get("gemini_circuit_rejections_total", {}).get((), 0)
+
+    requests, rejected = server.stats["requests"], rejections()
+    result = outcomes([stream() for _ in range(5)])
+    check(result["rejected"] == 5 and server.stats["requests"] == requests,
+          f"while open, 5 streams were rejected without reaching the server ({result}, {server.stats['requests'] - requests} requests)")
+    check(rejections() - rejected == 5, f"gemini_circuit_rejections_total counted the rejected streams (+{rejections() - rejected})")
+
+    time.sleep(COOLDOWN + 0.1)
+    server.error_rate, server.latency = 0.0, 0.3 # 시험 호출이 끝나기 전에 나머지가 도착하도록 느리게 응답합니다.
+    requests = server.stats["requests"]
+    result = outcomes([stream() for _ in range(args.concurrent)])
+    check(server.stats["requests"] - requests == 1 and result == {"ok": 1, "rejected": args.concurrent - 1, "failed": 0},
+          f"half-open: {args.concurrent} concurrent streams sent {server.stats['requests'] - requests} probe ({result})")
+    check(breaker.state == app.CircuitBreaker.CLOSED, "a successful probe closed the breaker")
+
+    server.error_rate, server.latency = 1.0, 0.01
+    for _ in range(THRESHOLD):
+        outcomes([stream()])
+    time.sleep(COOLDOWN + 0.1)
+    server.error_rate = 0.0
+    outcomes([stream(stop_after_first=True)])
+    result = outcomes([stream()])
+    check(result["ok"] == 1, f"after an abandoned probe stream the next stream may probe again ({result}, state {breaker.state})")
+
+    resilience, scheduler = app.get_gemini_resilience(), app.get_request_scheduler()
+    server.error_rate = 1.0
+    for _ in range(THRESHOLD):
+        outcomes([stream()])
+    time.sleep(COOLDOWN + 0.1)
+    server.error_rate = 0.0
+    acquire = scheduler.acquire
+
+    async def quota_exhausted(kind):
+        raise app.GeminiAPIError("오늘 AI 호출 한도에 도달했습니다. 내일 다시 시도해주세요.")
+
+    scheduler.acquire, requests = quota_exhausted, server.stats["requests"]
+    try:
+        client.run(app.call_gemini_api(prompt, schema, kind="hint"))
+    except app.GeminiAPIError:
+        pass
+    scheduler.acquire = acquire
+    check(breaker.state == app.CircuitBreaker.HALF_OPEN and server.stats["requests"] == requests,
+          f"a daily-quota error while half-open did not close the breaker (state {breaker.state}, "
+          f"{server.stats['requests'] - requests} requests)")
+    result = client.run(app.call_gemini_api(prompt, schema, kind="hint"))
+    check(result is not None and breaker.state == app.CircuitBreaker.CLOSED and server.stats["requests"] == requests + 1,
+          f"the next call probed the server and closed the breaker (state {breaker.state})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""공유 이벤트 루프와 커넥션 풀(GeminiClient)이 연결을 재사용하는지, 지연이 얼마나 줄어드는지 잽니다.
+
+가짜 Gemini 서버에 --sessions 개의 세션(스레드)이 --calls 번씩 문제 생성 요청을 보냅니다.
+
+- 요청마다 새 클라이언트: 예전 코드처럼 호출마다 asyncio.run() 으로 이벤트 루프를 만들고
+  httpx.AsyncClient 를 새로 엽니다.
+- 공유 풀: 앱의 call_gemini_api 를 get_gemini_client() 의 루프에 제출합니다.
+
+두 방식의 서버 측 TCP 연결 수와 호출 지연 p50/p99 를 출력하고, 공유 풀이 풀 크기 이하의 연결만 열었는지 확인합니다.
+
+사용 예:
+    python bench/gemini_client.py
+    python bench/gemini_client.py --sessions 50 --calls 10 --latency 0.05
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+import httpx
+
+from _common import check, fake_gemini_secrets, load_app, percentile, start_fake_gemini
+
+POOL_SIZE = 20
+
+
+def run_sessions(sessions, calls, call):
+    """sessions 개의 스레드가 동시에 call() 을 calls 번씩 부르고, 호출마다 걸린 시간을 모아 반환합니다."""
+    latencies, lock = [], threading.Lock()
+    start = threading.Barrier(sessions)
+
+    def session():
+        start.wait()
+        for _ in range(calls):
+            started = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=session) for _ in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50, help="동시 세션 수")
+    parser.add_argument("--calls", type=int, default=10, help="세션마다 보낼 요청 수")
+    parser.add_argument("--latency", type=float, default=0.02, help="가짜 Gemini 평균 응답 지연(초)")
+    args = parser.parse_args()
+
+    server = start_fake_gemini(latency=args.latency, jitter=args.latency / 4)
+    app = load_app(secrets=fake_gemini_secrets(server, GEMINI_POOL_SIZE=POOL_SIZE))
+    prompt, schema = app.build_hint_request({"title": "두 수의 합", "description": "a와 b를 더하세요"}, "Python")
+    api_url = f"{server.base_url}/v1beta/models/bench-model:generateContent?key=bench-key"
+
+    def new_client_call():
+        async def once():
+            async with httpx.AsyncClient(timeout=90) as http:
+                response = await http.post(api_url, json=app.gemini_payload(prompt, schema))
+                response.raise_for_status()
+                return response.json()
+        return asyncio.run(once())
+
+    client = app.get_gemini_client()
+
+    def shared_pool_call():
+        return client.run(app.call_gemini_api(prompt, schema, kind="hint"))
+
+    results = {}
+    for name, call in (("new client per call", new_client_call), ("shared pool", shared_pool_call)):
+        connections_before = server.stats["connections"]
+        started = time.perf_counter()
+        latencies = run_sessions(args.sessions, args.calls, call)
+        wall = time.perf_counter() - started
+        results[name] = {"connections": server.stats["connections"] - connections_before,
+                         "p50": percentile(latencies, 0.5), "p99": percentile(latencies, 0.99)}
+        print(f"{name:<20} {len(latencies)} calls in {wall:.1f}s · connections {results[name]['connections']:>4} · "
+              f"p50 {results[name]['p50'] * 1000:.0f}ms · p99 {results[name]['p99'] * 1000:.0f}ms")
+
+    shared, baseline = results["shared pool"], results["new client per call"]
+    check(shared["connections"] <= POOL_SIZE, f"shared pool opened {shared['connections']} connections (pool size {POOL_SIZE})")
+    check(baseline["connections"] == args.sessions * args.calls, f"new client per call opened {baseline['connections']} connections")
+    print(f"p50 {baseline['p50'] / shared['p50']:.1f}x faster, p99 {baseline['p99'] / shared['p99']:.1f}x faster with the shared pool")
+
+
+if __name__ == "__main__":
+    main()
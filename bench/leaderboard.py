@@ -0,0 +1,119 @@
+"""리더보드 순위와 상위 K 명 조회가 사용자 수와 무관하게 1ms 안에 끝나는지, 여러 프로세스의 점수 변경이 반영되는지 확인합니다.
+
+사용자 --users 명을 채운 users.db 에서 점수 분포(score_counts)를 처음 만드는 시간, 범위(전체/언어/언어·레벨)별
+rank() 와 top(10) 의 p50/p99, 트리거가 붙은 add_points 의 p50 을 출력합니다. 이어서 리더보드를 먼저 만든 뒤
+여러 프로세스가 점수 로그를 쓰며 점수를 바꾸고(그중 하나는 반영하지 않고 죽습니다) 남은 로그를 인수한 다음,
+순위가 COUNT(*) 로 센 값과 같고 상위 목록의 순위가 목록 안의 위치와 맞는지 확인합니다.
+
+사용 예:
+    python bench/leaderboard.py
+    python bench/leaderboard.py --users 100000 --ops 5000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+
+from _common import check, load_app, percentile
+
+LANGUAGES = ["Python", "C", "Java"]
+LEVELS = ["Level 1: 기초 문법", "Level 2: 자료 구조", "Level 3: 알고리즘"]
+SCOPES = [(), ("Python",), ("Python", "Level 2: 자료 구조")]
+
+
+def populate(db_path, users):
+    """UserStore 스키마에 언어/레벨과 점수가 다양한 사용자를 한 번에 채웁니다."""
+    rng = random.Random(users)
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany("INSERT INTO users (username, password, skill_test_taken, language, level, total_score) VALUES (?, 'x', 1, ?, ?, ?)",
+                         ((f"u{i}", rng.choice(LANGUAGES), rng.choice(LEVELS), int(rng.expovariate(1 / 800))) for i in range(users)))
+    conn.close()
+
+
+def timed(calls):
+    timings = []
+    for call in calls:
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def _score_worker(job):
+    app_dir, db_path, journal_path, users, count, seed, crash = job
+    app = load_app(app_dir)
+    store = app.UserStore(db_path, journal_path=journal_path, compact_seconds=0.05)
+    rng = random.Random(seed)
+    for i in range(count):
+        username = f"u{rng.randrange(users)}"
+        if i % 50 == 0:
+            store.update_profile(username, language=rng.choice(LANGUAGES), level=rng.choice(LEVELS))
+        store.add_points(username, rng.randint(-50, 300), solved_problem={"id": f"s{seed}_{i}", "title": "t"} if i % 4 == 0 else None)
+    if crash:
+        os._exit(0) # 로그를 반영하지 않고 끝납니다. 다른 프로세스가 남은 로그를 인수합니다.
+    store.compact()
+
+
+def brute_rank(conn, score, scope):
+    where = "".join(f" AND {column} = ?" for column in ("language", "level")[:len(scope)])
+    above = conn.execute(f"SELECT COUNT(*) FROM users WHERE total_score > ?{where}", (score, *scope)).fetchone()[0]
+    total = conn.execute(f"SELECT COUNT(*) FROM users WHERE 1{where}", scope).fetchone()[0]
+    return above + 1, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000, help="채울 사용자 수")
+    parser.add_argument("--ops", type=int, default=2000, help="범위마다 rank/top 호출 횟수")
+    parser.add_argument("--processes", type=int, default=4, help="점수를 바꾸는 프로세스 수")
+    parser.add_argument("--updates", type=int, default=500, help="프로세스마다 점수 변경 횟수")
+    args = parser.parse_args()
+
+    app = load_app()
+    workdir = os.getcwd()
+    db_path = os.path.join(workdir, "users.db")
+    store = app.UserStore(db_path)
+    populate(db_path, args.users)
+    started = time.perf_counter()
+    leaderboard = app.Leaderboard(store)
+    print(f"{args.users} users: score_counts built in {time.perf_counter() - started:.2f}s")
+
+    rng = random.Random(1)
+    print(f"{'scope':<32} {'rank p50/p99 us':>18} {'top(10) p50/p99 us':>20}")
+    for scope in SCOPES:
+        ranks = timed([lambda: leaderboard.rank(int(rng.expovariate(1 / 800)), scope)] * args.ops)
+        tops = timed([lambda: leaderboard.top(10, scope)] * args.ops)
+        label = " / ".join(scope) or "전체"
+        print(f"{label:<32} {percentile(ranks, 0.5) * 1e6:>8.0f} / {percentile(ranks, 0.99) * 1e6:<8.0f} "
+              f"{percentile(tops, 0.5) * 1e6:>9.0f} / {percentile(tops, 0.99) * 1e6:<8.0f}")
+        check(percentile(ranks, 0.99) < 1e-3 and percentile(tops, 0.99) < 1e-3,
+              f"{label}: rank and top(10) p99 under 1ms at {args.users} users")
+    writes = timed([lambda: store.add_points(f"u{rng.randrange(args.users)}", 10)] * args.ops)
+    print(f"add_points p50 {percentile(writes, 0.5) * 1e6:.0f}us (score_counts triggers included)")
+
+    # 리더보드를 만든 프로세스와 다른 프로세스들이 점수를 바꾸고, 한 프로세스는 로그를 반영하지 않고 죽습니다.
+    journal_path = os.path.join(workdir, "score_journal.log")
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_score_worker, args=((workdir, db_path, journal_path, args.users, args.updates, seed, seed == 0),))
+               for seed in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    app.UserStore(db_path, journal_path=journal_path) # 시작할 때 죽은 프로세스의 로그를 인수해 반영합니다.
+    conn = sqlite3.connect(db_path)
+    mismatches = 0
+    for scope in SCOPES:
+        for score in [0, 1, 255, 256, 800, 5000, 20000] + [rng.randrange(10000) for _ in range(50)]:
+            mismatches += leaderboard.rank(score, scope) != brute_rank(conn, score, scope)
+        rows = leaderboard.top(10, scope)
+        mismatches += sum(rank != brute_rank(conn, score, scope)[0] for rank, _, score in rows)
+    check(mismatches == 0, f"after {args.processes} processes x {args.updates} updates (one crashed before applying its journal), "
+                           f"ranks match COUNT(*) in every scope ({mismatches} mismatches)")
+
+
+if __name__ == "__main__":
+    main()
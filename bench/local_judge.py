@@ -0,0 +1,91 @@
+"""로컬 채점(LocalJudge)이 초당 몇 건의 제출을 처리하는지, 격리했을 때와 하지 않았을 때 판정이 같은지 확인합니다.
+
+정답/오답/무한 루프/예외/문법 오류인 Python 제출과 (gcc 가 있으면) 같은 종류의 C 제출을 섞어
+LOCAL_JUDGE_WORKERS 개(기본값: CPU 수)의 동시 요청으로 보내고 초당 처리 건수와 판정별 p50/p99 를 출력합니다.
+unshare 샌드박스를 만들 수 있으면 격리한 채로 한 번, 자원 제한만 건 채로(LOCAL_JUDGE_ALLOW_UNISOLATED 와 같음)
+한 번 돌리고, 두 경우 모두 제출마다 기대한 판정이 나오는지와 작업자 수만큼 처리량이 늘어나는지 확인합니다.
+
+사용 예:
+    python bench/local_judge.py
+    python bench/local_judge.py --workers 8 --submissions 400
+"""
+import argparse
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import check, load_app, percentile
+
+PROBLEM = {"function_stub": "def solution(n, s):", "example_input": "n = 4, s = \"ab\"", "example_output": "\"abababab\""}
+C_PROBLEM = {"function_stub": "char* solution(int n, char* s)", "example_input": "n = 4, s = \"ab\"", "example_output": "\"abababab\""}
+
+SUBMISSIONS = [
+    ("Python", PROBLEM, "def solution(n, s):\n    return s * n\n", "passed"),
+    ("Python", PROBLEM, "def solution(n, s):\n    return s * (n - 1)\n", "wrong_answer"),
+    ("Python", PROBLEM, "def solution(n, s):\n    while True:\n        pass\n", "time_limit"),
+    ("Python", PROBLEM, "def solution(n, s):\n    return s[n * 10]\n", "runtime_error"),
+    ("Python", PROBLEM, "def solution(n, s)\n    return s * n\n", "compile_error"),
+    ("C", C_PROBLEM, "char* solution(int n, char* s) {\n    static char out[64]; out[0] = 0;\n"
+                     "    for (int i = 0; i < n; i++) strcat(out, s);\n    return out;\n}\n", "passed"),
+    ("C", C_PROBLEM, "char* solution(int n, char* s) {\n    return s;\n}\n", "wrong_answer"),
+    ("C", C_PROBLEM, "char* solution(int n, char* s) {\n    for (;;) n++;\n    return s;\n}\n", "time_limit"),
+    ("C", C_PROBLEM, "char* solution(int n, char* s) {\n    return *(char**)0;\n}\n", "runtime_error"),
+    ("C", C_PROBLEM, "char* solution(int n, char* s) {\n    return s\n}\n", "compile_error"),
+]
+
+
+def run(judge, submissions, workers):
+    """submissions 를 workers 개의 동시 요청으로 채점하고 (초당 처리 건수, 판정별 지연, 틀린 판정 목록) 을 반환합니다."""
+    def one(item):
+        language, problem, code, expected = item
+        started = time.perf_counter()
+        status = judge.check(code, problem, language)["status"]
+        return expected, status, time.perf_counter() - started, language
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(one, submissions))
+    elapsed = time.perf_counter() - started
+    latencies = defaultdict(list)
+    wrong = []
+    for expected, status, seconds, language in results:
+        latencies[expected].append(seconds)
+        if status != expected:
+            wrong.append(f"{language} {expected} -> {status}")
+    return len(submissions) / elapsed, latencies, wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("LOCAL_JUDGE_WORKERS", os.cpu_count() or 2)),
+                        help="LocalJudge 풀 크기이자 동시 요청 수 (기본값: LOCAL_JUDGE_WORKERS 또는 CPU 수)")
+    parser.add_argument("--submissions", type=int, default=200, help="모드마다 채점할 제출 수")
+    parser.add_argument("--sandbox-user", default=os.environ.get("LOCAL_JUDGE_USER", "nobody"),
+                        help="루트로 실행할 때 제출 코드를 실행할 사용자 (기본값: LOCAL_JUDGE_USER 또는 nobody)")
+    parser.add_argument("--cpu-seconds", type=int, default=1, help="제출마다 CPU 시간 제한(초). 무한 루프 제출이 이만큼 걸립니다")
+    args = parser.parse_args()
+
+    app = load_app()
+    modes = [("isolated", {"isolate": True}), ("unisolated", {"isolate": False, "allow_unisolated": True})]
+    for mode, options in modes:
+        options.update(cpu_seconds=args.cpu_seconds, sandbox_user=args.sandbox_user)
+        judge = app.LocalJudge(max_workers=args.workers, **options)
+        if not judge.runs_examples:
+            print(f"{mode}: submissions cannot be run on this host (see the warning above), skipped")
+            continue
+        submissions = [item for item in SUBMISSIONS if item[0] == "Python" or judge.has_gcc]
+        batch = [submissions[i % len(submissions)] for i in range(args.submissions)]
+        single, _, _ = run(app.LocalJudge(max_workers=1, **options), batch[:len(batch) // 4], 1)
+        throughput, latencies, wrong = run(judge, batch, args.workers)
+        print(f"{mode}: {throughput:.1f} submissions/s with {args.workers} workers ({single:.1f}/s with 1)")
+        for expected, values in sorted(latencies.items()):
+            print(f"  {expected:<14} p50 {percentile(values, 0.5) * 1e3:7.0f}ms  p99 {percentile(values, 0.99) * 1e3:7.0f}ms")
+        check(not wrong, f"{mode}: every {'Python/C' if judge.has_gcc else 'Python'} submission gets the expected verdict"
+                         + (f" ({len(wrong)} wrong, e.g. {wrong[0]})" if wrong else ""))
+        if min(args.workers, os.cpu_count() or 1) > 1: # 제출 코드는 CPU 를 쓰므로 CPU 가 하나면 작업자를 늘려도 빨라지지 않습니다.
+            check(throughput > single * 1.5, f"{mode}: {args.workers} workers process more than 1.5x the submissions/s of 1 worker")
+
+
+if __name__ == "__main__":
+    main()
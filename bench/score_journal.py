@@ -0,0 +1,160 @@
+"""점수 로그(ScoreJournal)의 지연, 강제 종료 복구, 다중 프로세스 안전성을 확인합니다.
+
+- 지연: 스레드 1/8/32개가 add_points 를 부를 때 로그를 쓰는 경우와 users.db 에 바로 쓰는 경우의
+  p50/p99, 처리량, fsync 횟수를 비교합니다.
+- 강제 종료: 점수를 계속 더하는 하위 프로세스를 무작위 시점에 SIGKILL 로 죽이고, 다시 연 저장소가
+  응답을 받은 갱신을 하나도 잃지 않았는지 --trials 번 확인합니다.
+- 다중 프로세스: 여러 프로세스가 같은 users.db 에 동시에 점수를 더한 뒤 합계가 맞는지, 같은 문제를 동시에
+  맞혔을 때 응답한 점수의 합이 실제로 더해진 점수와 같은지, 그중 하나를
+  SIGKILL 로 죽여도 살아 있는 프로세스가 그 로그를 넘겨받아 반영하는지 확인합니다.
+
+사용 예:
+    python bench/score_journal.py
+    python bench/score_journal.py --trials 50 --processes 4 --per-process 500
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from _common import check, load_app, percentile
+
+
+def open_store(app, workdir, journal=True, compact_seconds=1.0):
+    return app.UserStore(os.path.join(workdir, "users.db"),
+                         journal_path=os.path.join(workdir, "score_journal.log") if journal else None,
+                         compact_seconds=compact_seconds)
+
+
+def run_child(workdir):
+    """점수를 계속 더하면서 응답받은 호출 번호를 한 줄씩 출력합니다. 부모가 SIGKILL 로 죽입니다."""
+    app = load_app(workdir)
+    store = open_store(app, workdir, compact_seconds=random.choice([0.005, 0.05, 0.5]))
+    i = 0
+    while True:
+        i += 1
+        store.add_points("alice", 1, solved_problem={"id": f"p{i}", "title": "t"} if i % 3 == 0 else None)
+        sys.stdout.write(f"{i}\n")
+        sys.stdout.flush()
+
+
+def kill_child_midway(directory, delay):
+    """run_child 를 띄워 첫 갱신이 응답받은 뒤 delay 초 지나면 SIGKILL 로 죽이고, (pid, 마지막으로 응답받은 번호) 를 반환합니다."""
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", directory], stdout=subprocess.PIPE, text=True)
+    first = child.stdout.readline()
+    time.sleep(delay)
+    os.kill(child.pid, signal.SIGKILL)
+    return child.pid, max(int(line) for line in [first] + child.communicate()[0].split())
+
+
+def measure_latency(app, workdir):
+    for threads in (1, 8, 32):
+        for journal in (False, True):
+            directory = os.path.join(workdir, f"latency_{threads}_{int(journal)}")
+            os.makedirs(directory)
+            store = open_store(app, directory, journal)
+            for t in range(threads):
+                store.create(f"u{t}", "x")
+            latencies, lock, calls = [], threading.Lock(), 1600 // threads
+
+            def work(t):
+                mine = []
+                for i in range(calls):
+                    started = time.perf_counter()
+                    store.add_points(f"u{t}", 5, solved_problem={"id": f"p{t}-{i}", "title": "t"}, language="Python", level="L1")
+                    mine.append(time.perf_counter() - started)
+                with lock:
+                    latencies.extend(mine)
+
+            started = time.perf_counter()
+            workers = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            wall = time.perf_counter() - started
+            stats = store.journal_stats()
+            print(f"threads {threads:>2} {'journal' if journal else 'direct ':<7}: p50 {percentile(latencies, 0.5) * 1e3:6.2f}ms · "
+                  f"p99 {percentile(latencies, 0.99) * 1e3:6.2f}ms · {len(latencies) / wall:6.0f} calls/s · fsyncs {stats['fsyncs']}/{stats['appends']}")
+
+
+def crash_trials(app, workdir, trials):
+    failed = 0
+    for trial in range(trials):
+        directory = os.path.join(workdir, f"crash_{trial}")
+        os.makedirs(directory)
+        open_store(app, directory, journal=False).create("alice", "x")
+        _, acked = kill_child_midway(directory, random.uniform(0.05, 0.5))
+        store = open_store(app, directory, compact_seconds=3600)
+        user = store.get("alice")
+        solved = {row[0] for row in store._conn().execute("SELECT problem_id FROM solved_problems")}
+        # 응답을 받은 갱신은 모두 남아야 하고, 응답 직전에 죽은 갱신 하나는 남을 수도 있습니다.
+        ok = (acked <= user["total_score"] <= acked + 1 and {f"p{i}" for i in range(3, acked + 1, 3)} <= solved
+              and len(solved) == user["solved_count"])
+        failed += not ok
+        if not ok:
+            print(f"trial {trial}: acknowledged {acked}, recovered total_score {user['total_score']}, solved {user['solved_count']}")
+    check(failed == 0, f"{trials - failed}/{trials} SIGKILL trials kept every acknowledged update")
+
+
+def _add_points_worker(job):
+    """count 번 점수를 더하고 응답받은 점수의 합을 반환합니다. same_problems 면 모든 프로세스가 같은 문제를 풉니다."""
+    workdir, count, same_problems = job
+    app = load_app(workdir)
+    store = open_store(app, workdir)
+    prefix = "same" if same_problems else f"w{os.getpid()}"
+    awarded = sum(store.add_points("shared", 1, solved_problem={"id": f"{prefix}_{i}", "title": "t"})[1] for i in range(count))
+    store.compact()
+    return awarded
+
+
+def multi_process(app, workdir, processes, per_process):
+    for same_problems, expected in ((False, processes * per_process), (True, per_process)):
+        directory = os.path.join(workdir, f"multi_{int(same_problems)}")
+        os.makedirs(directory)
+        open_store(app, directory, journal=False).create("shared", "x")
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            awarded = sum(pool.map(_add_points_worker, [(directory, per_process, same_problems)] * processes))
+        user = open_store(app, directory).get("shared")
+        # 응답한 점수(채점 화면과 제출 기록에 남는 값)가 모두 실제로 더해져야 합니다.
+        check(user["total_score"] == expected == awarded and user["solved_count"] == expected,
+              f"{processes} processes x {per_process} add_points on {'the same' if same_problems else 'different'} problems: "
+              f"total_score {user['total_score']}, acknowledged {awarded}, solved {user['solved_count']} (expected {expected})")
+
+    # 한 프로세스가 반영하기 전에 죽으면 살아 있는 프로세스의 압축 스레드가 그 로그를 넘겨받습니다.
+    directory = os.path.join(workdir, "orphan")
+    os.makedirs(directory)
+    survivor = open_store(app, directory, compact_seconds=0.1)
+    survivor.create("alice", "x")
+    pid, acked = kill_child_midway(directory, 0.3)
+    time.sleep(0.5)
+    total = survivor.get("alice")["total_score"]
+    leftovers = [name for name in os.listdir(directory) if name.startswith(f"score_journal.{pid}_")]
+    check(acked <= total <= acked + 1 and not leftovers,
+          f"running process adopted the killed process's journal: acknowledged {acked}, total_score {total}, leftover files {leftovers}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trials", type=int, default=20, help="SIGKILL 복구 시험 횟수")
+    parser.add_argument("--processes", type=int, default=2, help="동시에 점수를 더할 프로세스 수")
+    parser.add_argument("--per-process", type=int, default=300, help="프로세스마다 add_points 호출 수")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return run_child(args.child)
+
+    app = load_app()
+    workdir = os.getcwd()
+    measure_latency(app, workdir)
+    crash_trials(app, workdir, args.trials)
+    multi_process(app, workdir, args.processes, args.per_process)
+
+
+if __name__ == "__main__":
+    main()
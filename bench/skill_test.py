@@ -0,0 +1,90 @@
+"""실력 테스트 문항 모수 추정(fit_item_parameters)과 적응형 문항 선택(AdaptiveSkillTest)을 모의 응답으로 확인합니다.
+
+참 모수(a, b)와 능력(theta)으로 응답 행렬을 만들어 추정 시간과 모수 복원 정도(상관계수, RMSE)를 출력하고,
+모의 응시자에게 적응형 테스트를 치르게 해 평균 문항 수, 레벨 적중률, 문항 선택 한 번의 시간을 출력합니다.
+적응형 테스트가 큰 문항 은행에서도 적은 문항으로 끝나고, 정한 레벨이 대부분 참 레벨과 한 단계 안에 있는지 확인합니다.
+정확히 맞힌 비율은 --se-target 을 낮추면 문항 수와 함께 올라가며, 문항을 모두 푼 경우를 기준으로 함께 출력합니다.
+
+사용 예:
+    python bench/skill_test.py
+    python bench/skill_test.py --people 1000 10000 --banks 10 40 --simulations 500
+"""
+import argparse
+import bisect
+import time
+
+import numpy as np
+
+from _common import check, load_app, percentile
+
+
+def simulate(app, rng, people, items, missing):
+    a, b, theta = rng.uniform(0.6, 2.2, items), rng.normal(0, 1, items), rng.normal(0, 1, people)
+    responses = (rng.random((people, items)) < app.irt_probability(a, b, theta[:, None])).astype(float)
+    if missing:
+        responses[rng.random((people, items)) < missing] = np.nan # 적응형 테스트처럼 일부 문항만 푼 응답자
+    return a, b, responses
+
+
+def take_tests(app, rng, a, b, simulations, se_target):
+    questions = [{"id": f"i{k}"} for k in range(len(a))]
+    params = {f"i{k}": {"a": a[k], "b": b[k]} for k in range(len(a))}
+    lengths, exact, near, exact_all, steps = [], 0, 0, 0, []
+    for theta in rng.normal(0, 1, simulations):
+        true_level = bisect.bisect_right(app.SKILL_LEVEL_CUTS, theta)
+        test = app.AdaptiveSkillTest("Python", questions, params, se_target=se_target)
+        while not test.finished:
+            started = time.perf_counter()
+            index = test.next_item()
+            test.answer(index, rng.random() < app.irt_probability(a[index], b[index], theta))
+            steps.append(time.perf_counter() - started)
+        level = app.SKILL_LEVELS.index(test.level())
+        lengths.append(len(test.answered))
+        exact += level == true_level
+        near += abs(level - true_level) <= 1
+        # 비교 기준: 같은 응시자가 문항을 모두 풀고 같은 추정식으로 레벨을 받는 경우
+        everything = rng.random(len(a)) < app.irt_probability(a, b, theta)
+        exact_all += bisect.bisect_right(app.SKILL_LEVEL_CUTS, app.estimate_ability(a, b, everything)[0]) == true_level
+    return {"items": float(np.mean(lengths)), "exact": exact / simulations, "near": near / simulations,
+            "exact_all": exact_all / simulations, "step_p50": percentile(steps, 0.5)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--people", type=int, nargs="+", default=[1000, 10_000, 100_000], help="모수 추정에 쓸 응답자 수")
+    parser.add_argument("--items", type=int, default=30, help="모수 추정에 쓸 문항 수")
+    parser.add_argument("--missing", type=float, default=0.5, help="응답하지 않은 칸의 비율")
+    parser.add_argument("--banks", type=int, nargs="+", default=[10, 40, 200], help="적응형 테스트 문항 은행 크기")
+    parser.add_argument("--simulations", type=int, default=1000, help="문항 은행마다 모의 응시자 수")
+    parser.add_argument("--se-target", type=float, default=0.5, help="적응형 테스트 종료 기준 표준오차")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    app = load_app()
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'people':>8} {'items':>5} {'missing':>7} {'fit ms':>8} {'a corr':>7} {'a rmse':>7} {'b corr':>7} {'b rmse':>7}")
+    for people in args.people:
+        a, b, responses = simulate(app, rng, people, args.items, args.missing)
+        started = time.perf_counter()
+        a_hat, b_hat = app.fit_item_parameters(responses)
+        elapsed = time.perf_counter() - started
+        a_corr, b_corr = np.corrcoef(a, a_hat)[0, 1], np.corrcoef(b, b_hat)[0, 1]
+        print(f"{people:>8} {args.items:>5} {args.missing:>7.0%} {elapsed * 1000:>8.0f} {a_corr:>7.3f} "
+              f"{np.sqrt(np.mean((a - a_hat) ** 2)):>7.3f} {b_corr:>7.3f} {np.sqrt(np.mean((b - b_hat) ** 2)):>7.3f}")
+        if people >= 10_000:
+            check(a_corr > 0.9 and b_corr > 0.98, f"{people} respondents recover the item parameters (a corr {a_corr:.3f}, b corr {b_corr:.3f})")
+
+    print(f"\n{'bank':>5} {'items':>6} {'exact':>6} {'within 1':>8} {'all items exact':>15} {'step us':>8}")
+    for bank in args.banks:
+        a, b = rng.uniform(0.8, 2.2, bank), rng.normal(0, 1.2, bank)
+        result = take_tests(app, rng, a, b, args.simulations, args.se_target)
+        print(f"{bank:>5} {result['items']:>6.1f} {result['exact']:>6.1%} {result['near']:>8.1%} "
+              f"{result['exact_all']:>15.1%} {result['step_p50'] * 1e6:>8.0f}")
+        if bank >= 40:
+            check(result["items"] < bank, f"bank of {bank}: adaptive test stops after {result['items']:.1f} items on average")
+        check(result["near"] > 0.9, f"bank of {bank}: {result['near']:.1%} of levels within one of the true level")
+
+
+if __name__ == "__main__":
+    main()
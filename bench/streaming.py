@@ -0,0 +1,68 @@
+"""스트리밍 채점/힌트 응답의 첫 글자 도착 시간(TTFT)과 끊긴 스트림의 대체 호출을 확인합니다.
+
+가짜 Gemini 서버가 응답을 16자 조각으로 --chunk-delay 초 간격을 두고 보냅니다.
+
+- TTFT: stream_gemini_api 의 첫 조각 도착 시간을 일반 호출(call_gemini_api)의 전체 응답 시간과 비교합니다.
+- 끊긴 스트림: 서버가 스트림을 절반만 보내고 연결을 끊게 한 뒤, stream_ai_response 가 도착한 부분을
+  그리고 일반 호출로 다시 받아 완성된 응답을 돌려주는지 확인합니다.
+
+사용 예:
+    python bench/streaming.py
+    python bench/streaming.py --calls 20 --chunk-delay 0.2
+"""
+import argparse
+import json
+import time
+
+from _common import check, fake_gemini_secrets, load_app, percentile, start_fake_gemini
+
+PROBLEM = {"title": "두 수의 합", "description": "정수 a와 b를 더한 값을 반환하세요."}
+SOLUTION = "def solution(a, b):\n    return a + b"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=10, help="방식마다 보낼 요청 수")
+    parser.add_argument("--latency", type=float, default=0.2, help="가짜 Gemini 의 첫 응답까지 지연(초)")
+    parser.add_argument("--chunk-delay", type=float, default=0.1, help="스트리밍 조각 사이 간격(초)")
+    args = parser.parse_args()
+
+    server = start_fake_gemini(latency=args.latency, jitter=0.0, chunk_delay=args.chunk_delay)
+    app = load_app(secrets=fake_gemini_secrets(server))
+    client = app.get_gemini_client()
+    prompt, schema = app.build_grading_request(SOLUTION, PROBLEM, "Python")
+
+    async def first_chunk():
+        started = time.perf_counter()
+        ttft, text = None, ""
+        async for chunk in app.stream_gemini_api(prompt, schema, kind="grade"):
+            ttft = ttft or time.perf_counter() - started
+            text += chunk
+        return ttft, time.perf_counter() - started, text
+
+    ttfts, stream_totals, full_calls = [], [], []
+    for _ in range(args.calls):
+        ttft, total, text = client.run(first_chunk())
+        ttfts.append(ttft)
+        stream_totals.append(total)
+        started = time.perf_counter()
+        client.run(app.call_gemini_api(prompt, schema, kind="grade"))
+        full_calls.append(time.perf_counter() - started)
+    check(json.loads(text)["is_correct"], "streamed chunks join into the complete JSON response")
+    print(f"streaming   TTFT p50 {percentile(ttfts, 0.5) * 1000:.0f}ms · p99 {percentile(ttfts, 0.99) * 1000:.0f}ms · "
+          f"last chunk p50 {percentile(stream_totals, 0.5) * 1000:.0f}ms")
+    print(f"full call   response p50 {percentile(full_calls, 0.5) * 1000:.0f}ms · p99 {percentile(full_calls, 0.99) * 1000:.0f}ms")
+    check(percentile(ttfts, 0.5) < percentile(full_calls, 0.5), "first streamed chunk arrives before the full response")
+
+    server.stream_break_rate = 1.0
+    broken_before, requests_before = server.stats["streams_broken"], server.stats["requests"]
+    rendered = []
+    result = app.stream_ai_response(prompt, schema, "feedback", rendered.append, kind="grade")
+    print(f"broken stream: rendered {len(rendered)} partial updates, then fell back to generateContent")
+    check(server.stats["streams_broken"] == broken_before + 1, "server cut the stream halfway")
+    check(server.stats["requests"] == requests_before + 2, "one streaming request and one fallback request were sent")
+    check(result == {"is_correct": True, "feedback": "좋아요"}, f"fallback returned the complete response {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""여러 프로세스가 같은 디렉터리에 제출 기록(SubmissionLog)을 남길 때 행이 유실되거나 사전 번호가 섞이지 않는지 확인합니다.
+
+--processes 개의 프로세스가 서로 다른 순서로 새 문자열(사용자, 문제)을 만들며 --rows 행씩 기록하고, 작은 세그먼트
+크기로 자주 봉인합니다. 그동안 부모 프로세스의 SubmissionLog 가 columns() 로 계속 읽으며 행 수가 줄어들지 않는지
+보고, 끝난 뒤 새로 연 로그에서 행 수와 프로세스별 사용자/점수 합계가 맞는지, 전체 analyze() 에 걸리는 시간을 출력합니다.
+
+사용 예:
+    python bench/submission_log.py
+    python bench/submission_log.py --processes 8 --rows 100000
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from _common import check, load_app
+
+
+def _writer(job):
+    workdir, worker, rows = job
+    app = load_app(workdir)
+    log = app.SubmissionLog(os.path.join(workdir, "submissions"), chunk_rows=4096, flush_seconds=0.05)
+    # 프로세스마다 문자열이 처음 나오는 순서를 다르게 해 사전 번호가 서로 달라지게 합니다.
+    for i in range(rows):
+        log.append(f"w{worker}_u{(i * (worker + 1)) % 97}", f"p{(i + worker * 13) % 211}", ("Python", "C", "Java")[(i + worker) % 3],
+                   "Level 1: 기초 문법", app.SubmissionLog.VERDICTS[i % 4], worker + 1, 100.0, 10)
+    log.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4, help="동시에 기록할 프로세스 수")
+    parser.add_argument("--rows", type=int, default=50_000, help="프로세스마다 기록할 행 수")
+    args = parser.parse_args()
+
+    app = load_app()
+    workdir = os.getcwd()
+    directory = os.path.join(workdir, "submissions")
+    reader = app.SubmissionLog(directory, flush_seconds=3600)
+    seen, shrank = [], False
+    with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+        result = pool.map_async(_writer, [(workdir, worker, args.rows) for worker in range(args.processes)])
+        while not result.ready():
+            rows = len(reader.columns()[0]["ts"])
+            shrank |= bool(seen) and rows < seen[-1]
+            seen.append(rows)
+            time.sleep(0.02)
+        result.get()
+    expected = args.processes * args.rows
+    check(not shrank, f"a reader running alongside the writers never saw the row count go down ({len(seen)} reads)")
+    check(len(reader.columns()[0]["ts"]) == expected, f"the running reader sees all {expected} rows once the writers finish")
+
+    started = time.perf_counter()
+    log = app.SubmissionLog(directory, flush_seconds=3600)
+    print(f"reopened {len(log):,} rows in {(time.perf_counter() - started) * 1000:.0f}ms")
+    columns, dictionary = log.columns()
+    check(len(log) == expected, f"{args.processes} processes x {args.rows} rows: {len(log)} rows on disk (expected {expected})")
+    check(bool(np.all(np.diff(columns["ts"]) >= 0)), "rows are in time order")
+    users = np.array(dictionary["user"])[columns["user"]]
+    for worker in range(args.processes):
+        mine = np.char.startswith(users, f"w{worker}_")
+        points = int(columns["points"][mine].sum())
+        check(mine.sum() == args.rows and points == args.rows * (worker + 1) and len(set(users[mine])) == min(97, args.rows),
+              f"process {worker}: {mine.sum()} rows, {len(set(users[mine]))} users, {points} points decode to what it wrote")
+
+    started = time.perf_counter()
+    summary = log.analyze()["summary"]
+    print(f"analyze() over {summary['submissions']:,} rows: {(time.perf_counter() - started) * 1000:.0f}ms, "
+          f"{summary['users']} users, {summary['problems']} problems, pass rate {summary['pass_rate']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""UserStore 작업 지연이 사용자 수와 무관하게 일정한지 재는 벤치마크입니다.
+
+사용자 100명부터 100만 명까지 채운 users.db 에서 get / has_solved / add_points 를 무작위 사용자에게
+--ops 번씩 호출하고 p50/p99 를 출력합니다. 마지막으로 여러 프로세스가 같은 사용자에게 동시에 점수를
+더해도 갱신이 유실되지 않는지, 같은 문제를 동시에 맞혀도 점수가 한 번만 더해지는지 확인합니다.
+문제를 --heavy-solves 개 푼 사용자(긴 ID/제목, 많은 언어·레벨 조합)의 문제 생성 프롬프트를 만들어
+푼 문제 요약이 SOLVED_SUMMARY_MAX_CHARS 를 넘지 않는지도 확인합니다.
+
+사용 예:
+    python bench/user_store.py
+    python bench/user_store.py --sizes 100 10000 --ops 5000
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import time
+
+from _common import check, load_app, percentile
+
+
+def populate(db_path, users, solved_per_user=5):
+    """UserStore 스키마에 사용자와 푼 문제를 한 번에 채웁니다. (create 를 100만 번 부르지 않도록 직접 삽입)"""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany("INSERT INTO users (username, password, skill_test_taken, language, level, total_score) VALUES (?, 'x', 1, 'Python', 'L1', ?)",
+                         ((f"u{i}", i % 1000) for i in range(users)))
+        conn.executemany("INSERT INTO solved_problems (username, problem_id, language, level, title) VALUES (?, ?, 'Python', 'L1', 't')",
+                         ((f"u{i}", f"p{j}") for i in range(users) for j in range(solved_per_user)))
+    conn.close()
+
+
+def measure(store, users, ops):
+    rng = random.Random(users)
+    timings = {"get": [], "has_solved": [], "add_points": []}
+    for i in range(ops):
+        username = f"u{rng.randrange(users)}"
+        for op, call in (("get", lambda: store.get(username)),
+                         ("has_solved", lambda: store.has_solved(username, "p3")),
+                         ("add_points", lambda: store.add_points(username, 1, solved_problem={"id": f"bench{i}", "title": "t"},
+                                                                 language="Python", level="L1"))):
+            started = time.perf_counter()
+            call()
+            timings[op].append(time.perf_counter() - started)
+    return timings
+
+
+def populate_heavy(db_path, solves):
+    """ID/제목이 길고 언어·레벨 조합이 많은 문제를 solves 개 푼 사용자 하나를 채웁니다."""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute("INSERT INTO users (username, password, skill_test_taken, language, level, total_score) VALUES ('heavy', 'x', 1, 'Python', 'L1', 0)")
+        conn.executemany("INSERT INTO solved_problems (username, problem_id, language, level, title) VALUES ('heavy', ?, ?, ?, ?)",
+                         ((f"AI_PY_L3_{i:06d}_" + "x" * 200, ["Python", "C", "Java"][i % 3], f"Level {i % 97}: " + "y" * 100, "제목" * 100)
+                          for i in range(solves)))
+    conn.close()
+
+
+def _add_points_worker(job):
+    app_dir, db_path, count, same_problems = job
+    app = load_app(app_dir)
+    store = app.UserStore(db_path)
+    prefix = "same" if same_problems else f"w{os.getpid()}"
+    for i in range(count):
+        store.add_points("shared", 1, solved_problem={"id": f"{prefix}_{i}", "title": "t"}, language="Python", level="L1")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10_000, 1_000_000], help="채울 사용자 수")
+    parser.add_argument("--ops", type=int, default=2000, help="크기마다 작업별 호출 횟수")
+    parser.add_argument("--processes", type=int, default=4, help="동시 갱신 확인에 쓸 프로세스 수")
+    parser.add_argument("--heavy-solves", type=int, default=10_000, help="프롬프트 크기를 확인할 사용자가 푼 문제 수")
+    args = parser.parse_args()
+
+    app = load_app()
+    workdir = os.getcwd()
+    print(f"{'users':>10}  " + "  ".join(f"{op + ' p50/p99 us':>26}" for op in ("get", "has_solved", "add_points")))
+    p50s = {}
+    for users in args.sizes:
+        db_path = os.path.join(workdir, f"users_{users}.db")
+        store = app.UserStore(db_path)
+        populate(db_path, users)
+        timings = measure(store, users, args.ops)
+        p50s[users] = percentile(timings["add_points"], 0.5)
+        print(f"{users:>10}  " + "  ".join(f"{percentile(t, 0.5) * 1e6:>12.0f} / {percentile(t, 0.99) * 1e6:<11.0f}" for t in timings.values()))
+    smallest, largest = min(p50s), max(p50s)
+    # 행 하나만 읽고 쓰므로 B-트리 깊이가 늘어나는 만큼만 느려져야 합니다.
+    check(p50s[largest] < 3 * p50s[smallest] + 50e-6,
+          f"add_points p50 {p50s[smallest] * 1e6:.0f}us at {smallest} users -> {p50s[largest] * 1e6:.0f}us at {largest} users")
+
+    db_path = os.path.join(workdir, "users_heavy.db")
+    store = app.UserStore(db_path)
+    populate_heavy(db_path, args.heavy_solves)
+    timings = []
+    for _ in range(20):
+        started = time.perf_counter()
+        summary = store.solved_summary("heavy")
+        timings.append(time.perf_counter() - started)
+    formatted = app.format_solved_summary(summary)
+    prompt, _ = app.build_generation_request("Python", "Level 3: 알고리즘", summary)
+    minimal = {"total": 1, "recent": [], "tag_counts": {}}
+    limit = len(app.build_generation_request("Python", "Level 3: 알고리즘", minimal)[0]) - len(app.format_solved_summary(minimal)) + app.SOLVED_SUMMARY_MAX_CHARS
+    print(f"{args.heavy_solves} solves: solved_summary p50 {percentile(timings, 0.5) * 1e3:.1f}ms, "
+          f"summary {len(formatted)} chars, generation prompt {len(prompt)} chars")
+    check(len(formatted) <= app.SOLVED_SUMMARY_MAX_CHARS and len(prompt) <= limit,
+          f"generation prompt for a user with {args.heavy_solves} solves stays within {limit} chars "
+          f"(summary capped at SOLVED_SUMMARY_MAX_CHARS = {app.SOLVED_SUMMARY_MAX_CHARS})")
+
+    per_process = 200
+    for same_problems, expected in ((False, per_process * args.processes), (True, per_process)):
+        db_path = os.path.join(workdir, f"users_shared_{int(same_problems)}.db")
+        app.UserStore(db_path).create("shared", "x")
+        with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+            pool.map(_add_points_worker, [(workdir, db_path, per_process, same_problems)] * args.processes)
+        user = app.UserStore(db_path).get("shared")
+        check(user["total_score"] == expected and user["solved_count"] == expected,
+              f"{args.processes} processes x {per_process} add_points on {'the same' if same_problems else 'different'} problems: "
+              f"total_score {user['total_score']}, solved {user['solved_count']} (expected {expected})")
+
+if __name__ == "__main__":
+    main()
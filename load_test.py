@@ -0,0 +1,446 @@
+"""streamlit_app.py 부하 테스트 도구.
+
+로컬에 가짜 Gemini 서버(지연, 오류율, 429 응답을 설정 가능)를 띄우고, streamlit.testing.v1.AppTest 로
+회원가입 → 실력 테스트 → 문제 생성 → 채점 → 힌트까지의 세션을 동시에 여러 개 실행합니다.
+AppTest 는 한 프로세스 안에서 여러 스레드로 돌릴 수 없으므로 세션마다 별도의 워커 프로세스를 사용하며,
+모든 워커는 같은 작업 디렉터리(users.db, api_usage.bin 등)를 공유합니다.
+
+채점 전에는 정답 코드를 한 글자씩 나눠 입력하는 타이핑 구간을 재현합니다. 앱이 에디터를
+"code_editor" 프래그먼트로 등록했다면 브라우저처럼 그 프래그먼트만 다시 실행하고, 아니면 전체
+스크립트를 다시 실행하므로 커밋 사이의 재실행 횟수와 타이핑 1분당 CPU 시간을 비교할 수 있습니다.
+
+사용 예:
+    python load_test.py --sessions 20 --latency 0.8 --rate-429 0.05 --output results.json
+    python load_test.py --compare results.json   # 이전 결과와 비교
+    python load_test.py --error-rate 0.2 --slow-rate 0.05   # 장애/꼬리 지연 주입
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILES = ["streamlit_app.py", "problems.json"]
+CORRECT_PYTHON_SOLUTION = "def solution(a, b):\n    return a + b"
+EDITOR_FRAGMENT_KEY = "code_editor"
+# 프래그먼트만 다시 실행하는 부분과 ScriptCache 공유는 AppTest 의 비공개 내부를 쓰므로 requirements.txt 에 고정한 버전에서만 확인했습니다.
+TESTED_STREAMLIT_VERSION = "1.65.0"
+
+
+# --- 가짜 Gemini 서버 ---
+class FakeGeminiServer(ThreadingHTTPServer):
+    """generateContent / streamGenerateContent 를 흉내 내는 로컬 서버입니다."""
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, latency=0.5, jitter=0.2, error_rate=0.0, rate_429=0.0, slow_rate=0.0, slow_latency=10.0,
+                 chunk_delay=0.0, stream_break_rate=0.0):
+        super().__init__(("127.0.0.1", 0), FakeGeminiHandler)
+        self.latency, self.jitter = latency, jitter
+        self.error_rate, self.rate_429 = error_rate, rate_429
+        self.slow_rate, self.slow_latency = slow_rate, slow_latency # 꼬리 지연(가끔 매우 느린 응답) 재현용
+        self.chunk_delay = chunk_delay # 스트리밍 조각 사이 간격(실제 모델이 토큰을 만드는 속도 재현용)
+        self.stream_break_rate = stream_break_rate # 스트림을 절반만 보내고 연결을 끊는 비율
+        self.stats = {"requests": 0, "streams": 0, "streams_broken": 0, "errors_sent": 0, "rate_limited": 0, "connections": 0}
+        self._lock = threading.Lock()
+        self._problem_seq = 0
+
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return # 앱이 헤징하거나 타임아웃으로 먼저 끊은 요청입니다.
+        super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def next_problem_id(self):
+        with self._lock:
+            self._problem_seq += 1
+            return f"AI_PY_LT_{self._problem_seq:05d}"
+
+    def answer_for(self, prompt):
+        if "Evaluate each of the following submissions" in prompt:
+            submissions = re.findall(r'<submission id="(\w+)">(.*?)</submission id="\1">', prompt, re.S)
+            return [{"id": submission_id, "is_correct": "return a + b" in block, "feedback": "좋아요" if "return a + b" in block else "다시 생각해 보세요"}
+                    for submission_id, block in submissions]
+        if "Evaluate a user's code" in prompt:
+            correct = "return a + b" in prompt
+            return {"is_correct": correct, "feedback": "좋아요" if correct else "다시 생각해 보세요"}
+        if "needs a hint" in prompt:
+            return {"hint": "두 값을 더하는 연산자를 떠올려 보세요."}
+        if "Create a new, unique programming problem" in prompt:
+            return {"id": self.next_problem_id(), "title": "두 수의 합", "description": "정수 a와 b를 더한 값을 반환하세요.",
+                    "function_stub": "solution(a, b)", "example_input": "a = 1, b = 2", "example_output": "3", "relative_difficulty": 3}
+        return {}
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, body, headers=()):
+        out = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(out)
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server.count("requests")
+        delay = max(0.0, random.gauss(server.latency, server.jitter))
+        time.sleep(server.slow_latency if random.random() < server.slow_rate else delay)
+        roll = random.random()
+        if roll < server.rate_429:
+            server.count("rate_limited")
+            return self._send_json(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}, [("Retry-After", "1")])
+        if roll < server.rate_429 + server.error_rate:
+            server.count("errors_sent")
+            return self._send_json(503, {"error": {"code": 503, "status": "UNAVAILABLE"}})
+        text = json.dumps(server.answer_for(body["contents"][0]["parts"][0]["text"]), ensure_ascii=False)
+        if "streamGenerateContent" in self.path:
+            server.count("streams")
+            events = [f"data: {json.dumps({'candidates': [{'content': {'parts': [{'text': text[i:i + 16]}]}}]})}\r\n\r\n".encode()
+                      for i in range(0, len(text), 16)]
+            broken = random.random() < server.stream_break_rate
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            if broken:
+                # 전체 길이를 알려 둔 뒤 절반만 보내고 끊으면 클라이언트는 전송 오류로 봅니다.
+                server.count("streams_broken")
+                self.send_header("Content-Length", str(sum(map(len, events))))
+                events = events[:len(events) // 2]
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for i, event in enumerate(events):
+                if i and server.chunk_delay:
+                    time.sleep(server.chunk_delay)
+                self.wfile.write(event)
+                self.wfile.flush()
+            self.close_connection = True
+            return
+        # 일반 호출은 모델이 마지막 조각까지 만든 뒤에야 응답합니다.
+        time.sleep(server.chunk_delay * max(0, (len(text) - 1) // 16))
+        self._send_json(200, {"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+
+# --- 세션 시뮬레이션 (워커 프로세스) ---
+def _read_proc_io():
+    try:
+        with open("/proc/self/io") as f:
+            return {k: int(v) for k, v in (line.split(": ") for line in f)}
+    except OSError:
+        return {}
+
+class ScriptedSession:
+    """AppTest 한 개로 사용자 한 명의 흐름을 실행하며 재실행(rerun)마다 지연과 I/O 를 기록합니다."""
+
+    def __init__(self, workdir, base_url, username, timeout, keystrokes=20):
+        import streamlit
+        from streamlit.testing.v1 import AppTest
+        if streamlit.__version__ == TESTED_STREAMLIT_VERSION:
+            import streamlit.testing.v1.local_script_runner as local_script_runner
+            from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+            # AppTest 는 실행마다 ScriptCache 를 새로 만들어 스크립트를 다시 컴파일하지만, 실제 서버는 컴파일된
+            # 바이트코드를 재사용합니다. 재실행 CPU 측정에 컴파일 비용이 섞이지 않도록 캐시를 공유합니다.
+            script_cache = ScriptCache()
+            local_script_runner.ScriptCache = lambda: script_cache
+        self.at = AppTest.from_file(os.path.join(workdir, "streamlit_app.py"), default_timeout=timeout)
+        self.at.secrets["GEMINI_API_KEY"] = "load-test"
+        self.at.secrets["GEMINI_API_BASE"] = base_url
+        self.username = username
+        self.keystrokes = keystrokes
+        self.records = []
+
+    def step(self, action, trigger=None, scope="full"):
+        """trigger 로 위젯을 조작한 뒤 재실행하고 결과를 기록합니다."""
+        io_before = _read_proc_io()
+        cpu_before = time.process_time() # AppTest 는 같은 프로세스의 스레드에서 스크립트를 실행합니다.
+        started = time.perf_counter()
+        (trigger() if trigger else self.at).run()
+        latency = time.perf_counter() - started
+        cpu = time.process_time() - cpu_before
+        io_after = _read_proc_io()
+        messages = [e.value for e in list(self.at.error) + list(self.at.warning) + list(self.at.toast)]
+        self.records.append({
+            "action": action,
+            "scope": scope,
+            "latency": latency,
+            "cpu": cpu,
+            "io": {k: io_after[k] - io_before.get(k, 0) for k in ("syscr", "syscw", "read_bytes", "write_bytes") if k in io_after},
+            "quota_rejected": any("한도" in str(m) for m in messages),
+            "exception": bool(self.at.exception),
+        })
+        if self.at.exception:
+            raise RuntimeError(f"{action}: {self.at.exception[0].message}")
+
+    def button(self, label):
+        return next(b for b in self.at.button if label in b.label)
+
+    def click(self, action, label):
+        """버튼을 눌러 재실행합니다. 호출 한도로 버튼이 비활성화되어 있으면 한도 거절로 기록하고 False 를 반환합니다."""
+        button = self.button(label)
+        if button.disabled:
+            self.records.append({"action": action, "scope": "full", "latency": None, "cpu": None, "io": {},
+                                 "quota_rejected": True, "exception": False})
+            return False
+        self.step(action, button.click)
+        return True
+
+    def text_input(self, label):
+        return next(t for t in self.at.text_input if t.label == label)
+
+    def set_editor(self, code):
+        problem = self.at.session_state["current_problem"]
+        self.at.session_state[f"ace_editor_{problem['id']}_Python"] = code
+
+    def _fragment_ids(self, key):
+        # AppTest 에는 프래그먼트만 다시 실행하는 공개 API 가 없어 내부 저장소에서 id 를 찾습니다.
+        # 내부 구조가 다를 수 있는 다른 버전에서는 빈 목록을 돌려주어 전체 재실행으로 측정합니다.
+        import streamlit
+        if streamlit.__version__ != TESTED_STREAMLIT_VERSION:
+            return []
+        storage = getattr(self.at, "_fragment_storage", None)
+        return list(getattr(storage, "_ids_by_target_key", {}).get(key, ()))
+
+    def _fragment_rerun(self, fragment_ids):
+        """브라우저가 프래그먼트 안의 위젯 값을 보낼 때처럼 해당 프래그먼트만 다시 실행하는 실행기를 반환합니다."""
+        session = self
+
+        class FragmentRerun:
+            def run(self):
+                import streamlit.testing.v1.local_script_runner as local_script_runner
+                rerun_data = local_script_runner.RerunData
+                tree = session.at._tree
+                local_script_runner.RerunData = functools.partial(rerun_data, fragment_id_queue=fragment_ids)
+                try:
+                    session.at.run()
+                finally:
+                    local_script_runner.RerunData = rerun_data
+                # 결과 트리에는 프래그먼트 요소만 있으므로, 화면의 나머지는 이전 실행 결과를 그대로 사용합니다.
+                exception = session.at.exception
+                session.at._tree = tree
+                if exception:
+                    raise RuntimeError(f"keystroke: {exception[0].message}")
+
+        return FragmentRerun()
+
+    def type_code(self, code, keystrokes):
+        """code 를 keystrokes 번에 나눠 입력하며 입력마다 에디터 값을 보내는 재실행을 기록합니다."""
+        fragment_ids = self._fragment_ids(EDITOR_FRAGMENT_KEY)
+        for i in range(1, keystrokes + 1):
+            self.set_editor(code[:len(code) * i // keystrokes])
+            if fragment_ids:
+                self.step("keystroke", lambda: self._fragment_rerun(fragment_ids), scope="fragment")
+            else:
+                self.step("keystroke")
+
+    def take_skill_test(self, max_questions=50):
+        """실력 테스트에 답합니다. 적응형 테스트는 문항마다 보기를 골라 "다음" 을 누르고, 고정 문항 테스트는 한 번에 제출합니다."""
+        rng = random.Random(self.username) # 세션마다 다르지만 실행마다 같은 응답 패턴을 씁니다.
+        for _ in range(max_questions):
+            if any(b.label == "다음" for b in self.at.button):
+                radio = self.at.radio[0]
+                radio.set_value(rng.choice(radio.options))
+                self.step("skill_test_answer", self.button("다음").click)
+            elif any(b.label == "결과 확인하기" for b in self.at.button):
+                self.step("skill_test_answer", self.button("결과 확인하기").click)
+            else:
+                return
+        raise RuntimeError(f"skill test did not finish within {max_questions} answers")
+
+    def run(self):
+        at = self.at
+        self.step("open")
+        self.text_input("새 사용자 이름").input(self.username)
+        self.text_input("새 비밀번호").input("load-test")
+        self.step("signup", self.button("회원가입").click)
+        self.text_input("사용자 이름").input(self.username)
+        self.text_input("비밀번호").input("load-test")
+        self.step("login", self.button("로그인").click)
+        self.step("start_skill_test", self.button("실력 테스트 시작하기").click)
+        self.take_skill_test()
+        if any("학습 시작하기" in b.label for b in at.button):
+            self.step("start_learning", self.button("학습 시작하기").click)
+        for round_no in range(2):
+            self.click("generate_problem", "새로운 문제 생성하기")
+            if "current_problem" not in at.session_state or not at.session_state["current_problem"]:
+                continue
+            self.click("hint", "힌트 보기") # 첫 라운드에서는 점수가 부족해 경고만 표시됩니다.
+            self.click("grade_wrong", "AI에게 채점받기")
+            self.type_code(CORRECT_PYTHON_SOLUTION, self.keystrokes)
+            self.set_editor(CORRECT_PYTHON_SOLUTION) # 주입한 값은 다음 실행 한 번에만 적용됩니다.
+            self.click("grade_correct", "AI에게 채점받기")
+            if "grading_result" in at.session_state and at.session_state["grading_result"]["correct"]:
+                self.click("next_problem", "다음 문제로")
+        return self.records
+
+def run_session(job):
+    workdir, base_url, username, timeout, keystrokes = job
+    os.chdir(workdir)
+    session = ScriptedSession(workdir, base_url, username, timeout, keystrokes)
+    try:
+        return {"records": session.run(), "error": None}
+    except Exception as e:
+        return {"records": session.records, "error": f"{type(e).__name__}: {e}"}
+
+
+# --- 결과 집계 ---
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+def summarize(results, wall_seconds, server, config):
+    by_action = {}
+    for result in results:
+        for record in result["records"]:
+            by_action.setdefault(record["action"], []).append(record)
+    actions = {}
+    for action, records in by_action.items():
+        executed = [r for r in records if r["latency"] is not None]
+        latencies = sorted(r["latency"] for r in executed) or [0.0]
+        io_keys = {k for r in executed for k in r["io"]}
+        actions[action] = {
+            "count": len(executed),
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": latencies[-1] * 1000,
+            "cpu_ms": sum(r["cpu"] for r in executed) / len(executed) * 1000 if executed else 0.0,
+            "io_per_rerun": {k: sum(r["io"].get(k, 0) for r in executed) / len(executed) for k in sorted(io_keys)},
+            "quota_rejections": sum(r["quota_rejected"] for r in records),
+        }
+    total_reruns = sum(a["count"] for a in actions.values())
+    keystrokes = by_action.get("keystroke", [])
+    typing_rate = config.get("typing_rate", 0)
+    typing = {
+        "keystrokes": len(keystrokes),
+        "full_reruns": sum(r["scope"] == "full" for r in keystrokes),
+        "fragment_reruns": sum(r["scope"] == "fragment" for r in keystrokes),
+        "cpu_ms_per_keystroke": actions["keystroke"]["cpu_ms"] if keystrokes else 0.0,
+    }
+    # 타이핑 1분 동안 에디터가 typing_rate 번 값을 보낸다고 보고 분당 재실행 수와 CPU 시간으로 환산합니다.
+    typing["full_reruns_per_typing_minute"] = typing_rate * typing["full_reruns"] / len(keystrokes) if keystrokes else 0.0
+    typing["cpu_seconds_per_typing_minute"] = typing["cpu_ms_per_keystroke"] * typing_rate / 1000
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=APP_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": config,
+        "wall_seconds": wall_seconds,
+        "reruns": total_reruns,
+        "throughput_reruns_per_s": total_reruns / wall_seconds if wall_seconds else 0.0,
+        "quota_rejections": sum(a["quota_rejections"] for a in actions.values()),
+        "session_errors": [r["error"] for r in results if r["error"]],
+        "server": dict(server.stats),
+        "typing": typing,
+        "actions": actions,
+    }
+
+def print_report(summary, baseline=None):
+    print(f"commit {summary['commit']} · {summary['reruns']} reruns in {summary['wall_seconds']:.1f}s "
+          f"({summary['throughput_reruns_per_s']:.2f}/s) · quota rejections {summary['quota_rejections']} · "
+          f"session errors {len(summary['session_errors'])}")
+    print(f"{'action':<18}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'cpu ms':>10}{'syscalls':>10}  vs baseline p50/p95")
+    for action, a in summary["actions"].items():
+        syscalls = a["io_per_rerun"].get("syscr", 0) + a["io_per_rerun"].get("syscw", 0)
+        diff = ""
+        if baseline and action in baseline["actions"]:
+            b = baseline["actions"][action]
+            diff = f"  {a['p50_ms'] - b['p50_ms']:+.0f} / {a['p95_ms'] - b['p95_ms']:+.0f} ms"
+        print(f"{action:<18}{a['count']:>5}{a['p50_ms']:>10.0f}{a['p95_ms']:>10.0f}{a['p99_ms']:>10.0f}{a['cpu_ms']:>10.0f}{syscalls:>10.0f}{diff}")
+    typing = summary["typing"]
+    if typing["keystrokes"]:
+        line = (f"typing: {typing['keystrokes']} keystrokes ({typing['full_reruns']} full / {typing['fragment_reruns']} fragment reruns) · "
+                f"per typing minute at {summary['config']['typing_rate']}/min: {typing['full_reruns_per_typing_minute']:.0f} full reruns, "
+                f"{typing['cpu_seconds_per_typing_minute']:.1f} CPU s")
+        if baseline and baseline.get("typing", {}).get("keystrokes"):
+            line += f" (baseline {baseline['typing']['full_reruns_per_typing_minute']:.0f} full reruns, {baseline['typing']['cpu_seconds_per_typing_minute']:.1f} CPU s)"
+        print(line)
+    for error in summary["session_errors"][:5]:
+        print(f"  session error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10, help="실행할 세션 수")
+    parser.add_argument("--concurrency", type=int, default=None, help="동시에 실행할 세션 수 (기본값: --sessions)")
+    parser.add_argument("--latency", type=float, default=0.5, help="가짜 Gemini 평균 응답 지연(초)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="응답 지연 표준편차(초)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="503 응답 비율")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="429 응답 비율")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="--slow-latency 만큼 늦게 응답하는 요청 비율")
+    parser.add_argument("--slow-latency", type=float, default=10.0, help="느린 요청의 응답 지연(초)")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="스트리밍 응답 조각 사이 간격(초)")
+    parser.add_argument("--stream-break-rate", type=float, default=0.0, help="스트리밍 응답을 중간에 끊는 비율")
+    parser.add_argument("--keystrokes", type=int, default=20, help="정답 코드를 나눠 입력하는 횟수 (에디터 값 전송 횟수)")
+    parser.add_argument("--typing-rate", type=float, default=120, help="타이핑 1분당 에디터 값 전송 횟수 (환산용)")
+    parser.add_argument("--timeout", type=float, default=120, help="재실행 한 번의 최대 대기 시간(초)")
+    parser.add_argument("--output", default="load_test_results.json", help="결과 JSON 경로")
+    parser.add_argument("--compare", default=None, help="비교할 이전 결과 JSON 경로")
+    args = parser.parse_args()
+    import streamlit
+    if streamlit.__version__ != TESTED_STREAMLIT_VERSION:
+        print(f"warning: streamlit {streamlit.__version__} is not the tested {TESTED_STREAMLIT_VERSION}; "
+              "typing is measured with full reruns and script compilation is included in rerun CPU time")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    server = FakeGeminiServer(args.latency, args.jitter, args.error_rate, args.rate_429, args.slow_rate, args.slow_latency,
+                              args.chunk_delay, args.stream_break_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    for name in APP_FILES:
+        shutil.copy(os.path.join(APP_DIR, name), workdir)
+    run_id = int(time.time())
+    jobs = [(workdir, server.base_url, f"lt{run_id}_{i}", args.timeout, args.keystrokes) for i in range(args.sessions)]
+
+    started = time.perf_counter()
+    with multiprocessing.get_context("spawn").Pool(args.concurrency or args.sessions) as pool:
+        results = pool.map(run_session, jobs)
+    wall_seconds = time.perf_counter() - started
+    server.shutdown()
+
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    summary = summarize(results, wall_seconds, server, config)
+    with open(args.output, "w") as f:
+        json.dump(summary, f, indent=4, ensure_ascii=False)
+    print_report(summary, baseline)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()